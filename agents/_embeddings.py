@@ -0,0 +1,86 @@
+"""Sentence embeddings shared by the agents' semantic cache and semantic search."""
+from functools import lru_cache
+from typing import List, Tuple
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+from agents._files import UMASK
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Identifies the vectors encode() produces, so persisted indexes built with another model are rebuilt
+MODEL_ID = "all-MiniLM-L6-v2-int8"
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
+QUANTIZED_DIR = os.path.join(MODELS_DIR, "minilm-int8")
+QUANTIZED_LOCK_PATH = os.path.join(MODELS_DIR, "minilm-int8.lock")
+QUANTIZED_FILE = "model_quantized.onnx"
+MAX_SEQ_LENGTH = 256
+
+def quantize_model():
+    """Export MiniLM to ONNX and dynamically quantize its weights to int8, saving the result to QUANTIZED_DIR."""
+    # Built in a temp dir and moved into place whole, so QUANTIZED_DIR never holds a model without its tokenizer
+    tmp_dir = tempfile.mkdtemp(dir=MODELS_DIR, suffix=".tmp")
+    try:
+        model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+        quantizer = ORTQuantizer.from_pretrained(model)
+        # Dynamic (weight-only) quantization needs no calibration data; ONNX Runtime uses VNNI int8 dot products where available
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+        AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(tmp_dir)
+        # mkdtemp creates the directory as 0700; give it the permissions a plain mkdir would
+        os.chmod(tmp_dir, 0o777 & ~UMASK)
+        # Clear out a partial export left behind by an interrupted run before older versions wrote atomically
+        shutil.rmtree(QUANTIZED_DIR, ignore_errors=True)
+        os.replace(tmp_dir, QUANTIZED_DIR)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def is_quantized() -> bool:
+    return os.path.exists(os.path.join(QUANTIZED_DIR, QUANTIZED_FILE))
+
+# Threads of one process wait on the lock; worker processes wait on the flock, so the model is exported only once
+model_lock = threading.Lock()
+
+def get_model() -> Tuple[PreTrainedTokenizerBase, ORTModelForFeatureExtraction]:
+    """Load the int8 model once per process, quantizing it first if it isn't on disk yet."""
+    with model_lock:
+        return load_model()
+
+@lru_cache(maxsize=None)
+def load_model() -> Tuple[PreTrainedTokenizerBase, ORTModelForFeatureExtraction]:
+    if not is_quantized():
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        with open(QUANTIZED_LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have finished the export while this one waited
+            if not is_quantized():
+                quantize_model()
+    tokenizer = AutoTokenizer.from_pretrained(QUANTIZED_DIR)
+    model = ORTModelForFeatureExtraction.from_pretrained(
+        QUANTIZED_DIR, file_name=QUANTIZED_FILE, provider="CPUExecutionProvider"
+    )
+    return tokenizer, model
+
+def encode(texts: List[str], batch_size: int = 64) -> np.ndarray:
+    """Embed texts as L2-normalized float32 rows, so an inner product is a cosine similarity."""
+    tokenizer, model = get_model()
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start:start + batch_size], padding=True, truncation=True,
+            max_length=MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        token_embeddings = model(**inputs).last_hidden_state
+        # Mean-pool over real tokens, as sentence-transformers does for MiniLM
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        batches.append(pooled / np.linalg.norm(pooled, axis=1, keepdims=True))
+    if not batches:
+        return np.empty((0, model.config.hidden_size), dtype=np.float32)
+    return np.concatenate(batches).astype(np.float32)
@@ -0,0 +1,21 @@
+"""Atomic replacement of the on-disk indexes, caches and models."""
+from typing import Callable
+import os
+import tempfile
+
+# Read once at import: os.umask can only be read by setting it, which briefly affects every thread
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def replace_file(path: str, write: Callable[[str], None]) -> None:
+    """Write through a uniquely named temp file and move it into place, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        # mkstemp creates the file as 0600; give it the permissions a plain open() would
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,23 @@
+"""Process-wide pooled HTTP client shared by every outbound call."""
+from functools import lru_cache
+from typing import Dict
+import httpx
+
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=15.0)
+TIMEOUT = httpx.Timeout(10.0)
+
+_internal_transports: Dict[str, httpx.AsyncBaseTransport] = {}
+
+def mount_internal(host: str, app) -> None:
+    """Serve requests for http://<host> from an in-process ASGI app. Must be called before get_client()."""
+    _internal_transports[f"all://{host}"] = httpx.ASGITransport(app=app)
+
+@lru_cache(maxsize=None)
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client; keep-alive connections are reused across requests."""
+    return httpx.AsyncClient(limits=LIMITS, timeout=TIMEOUT, http2=True, mounts=_internal_transports)
+
+async def close_client() -> None:
+    """Close the shared client; the next get_client() call builds a fresh one."""
+    await get_client().aclose()
+    get_client.cache_clear()
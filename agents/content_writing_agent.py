@@ -1,26 +1,267 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import Response as HttpResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, List, Literal, Optional, Tuple
 import uvicorn
-import google.generativeai as genai
+from google import genai
+from google.genai import types
 import os
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import tempfile
+import faiss
+import ahocorasick
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from agents._embeddings import encode
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+MODEL_NAME = "gemini-1.5-flash"
+
+@lru_cache(maxsize=None)
+def get_genai_client() -> genai.Client:
+    """Create the Gemini client on first use, so importing the agent does not require an API key."""
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+# Tasks that tolerate minutes of latency default to the discounted Flex tier
+FLEX_TASKS = {"editing", "summarization"}
+
+# Response cache: exact prompt hits first, then near-duplicate prompts by embedding similarity
+SEMANTIC_THRESHOLD = 0.95
+CACHE_MAXSIZE = 10_000
+CACHE_TTL = 3600
+exact_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
+# Per task: embeddings of past queries and the (inserted_at, response) stored for each row
+semantic_cache: Dict[str, Tuple[faiss.IndexFlatIP, List[Tuple[float, str]]]] = {}
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return " ".join(prompt.split())
+
+async def generate(prompt: str, service_tier: str) -> str:
+    """Call Gemini on the requested service tier."""
+    response = await get_genai_client().aio.models.generate_content(
+        model=MODEL_NAME,
+        contents=prompt,
+        config=types.GenerateContentConfig(service_tier=service_tier)
+    )
+    # Priority requests may be downgraded to Standard when capacity is short
+    usage = response.usage_metadata
+    if service_tier == "priority" and usage and usage.traffic_type and usage.traffic_type != types.TrafficType.ON_DEMAND_PRIORITY:
+        logger.info("[generate] Priority request was served as %s", usage.traffic_type.value)
+    return response.text
+
+class GeminiBatcher:
+    """
+    Coalesce prompts that arrive within a short window into one dispatch.
+
+    Callers await process(); a background worker collects up to max_batch_size
+    prompts, waiting at most max_queue_time after the first one, and sends the
+    whole batch to Gemini concurrently, calling it once per distinct prompt and tier.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_queue_time: float = 0.02):
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending: set = set()
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self.collect())
+
+    async def stop(self):
+        """Stop the worker and fail every prompt that hasn't been answered yet."""
+        if self.worker:
+            self.worker.cancel()
+            self.worker = None
+        for task in list(self.pending):
+            task.cancel()
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        while self.queue and not self.queue.empty():
+            _, _, future = self.queue.get_nowait()
+            self.fail([future])
+        self.queue = None
+
+    async def process(self, prompt: str, service_tier: str) -> str:
+        # Started on first use, so callers that bypass the app's startup hook still work
+        if self.worker is None or self.worker.done() or self.loop is not asyncio.get_running_loop():
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((prompt, service_tier, future))
+        return await future
+
+    def fail(self, futures):
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError("Gemini batcher stopped before the prompt was answered"))
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_queue_time
+            try:
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                self.fail([future for _, _, future in batch])
+                raise
+            # Dispatch in the background so the next batch can start collecting immediately
+            task = asyncio.create_task(self.process_batch(batch))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def process_batch(self, batch):
+        # Identical prompts that land in the same window share one Gemini call
+        groups: Dict[Tuple[str, str], List[asyncio.Future]] = {}
+        for prompt, service_tier, future in batch:
+            groups.setdefault((prompt, service_tier), []).append(future)
+        try:
+            results = await asyncio.gather(
+                *[generate(prompt, service_tier) for prompt, service_tier in groups],
+                return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            self.fail([future for _, _, future in batch])
+            raise
+        for futures, result in zip(groups.values(), results):
+            for future in futures:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+batcher = GeminiBatcher()
+
+async def get_or_compute(task: str, query: str, prompt: str, service_tier: str = "standard") -> str:
+    """Return a cached response for the prompt, calling Gemini only on a genuine miss."""
+    key = hashlib.sha256(f"{task}\x00{normalize_prompt(prompt)}".encode()).hexdigest()
+    if key in exact_cache:
+        return exact_cache[key]
+
+    # Only the user's request is embedded: the task template would dominate the vector,
+    # and the task already selects the index
+    try:
+        embedding = await asyncio.to_thread(encode, [normalize_prompt(query)])
+    except Exception as e:
+        # The semantic tier is only an optimisation, so a failing embedder counts as a miss
+        logger.warning("[get_or_compute] Embedding failed, skipping the semantic cache: %s", e)
+        response_text = await batcher.process(prompt, service_tier)
+        exact_cache[key] = response_text
+        return response_text
+    index, responses = semantic_cache.setdefault(task, (faiss.IndexFlatIP(embedding.shape[1]), []))
+    stale_row, stale_entry = None, None
+    if index.ntotal:
+        scores, ids = index.search(embedding, 1)
+        if scores[0][0] >= SEMANTIC_THRESHOLD:
+            row = int(ids[0][0])
+            inserted_at, response_text = responses[row]
+            if time.time() - inserted_at < CACHE_TTL:
+                exact_cache[key] = response_text
+                return response_text
+            # Expired: recompute and refresh this row in place rather than adding a duplicate
+            stale_row, stale_entry = row, responses[row]
+
+    response_text = await batcher.process(prompt, service_tier)
+
+    exact_cache[key] = response_text
+    # The row is only reused if the index wasn't reset while Gemini was answering
+    if stale_row is not None and stale_row < len(responses) and responses[stale_row] is stale_entry:
+        responses[stale_row] = (time.time(), response_text)
+        return response_text
+    # The flat index has no eviction, so start over once it reaches the exact tier's size
+    if index.ntotal >= CACHE_MAXSIZE:
+        index.reset()
+        responses.clear()
+    index.add(embedding)
+    responses.append((time.time(), response_text))
+    return response_text
 
 class Query(BaseModel):
     query: str
     context: Optional[Dict[str, Any]] = None
+    service_tier: Optional[Literal["standard", "flex", "priority"]] = None
 
 class Response(BaseModel):
     result: str
     confidence: float
     metadata: Optional[Dict[str, Any]] = None
 
-app = FastAPI(title="Content Writing Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The batcher starts on first use; shutting down fails whatever is still queued
+    try:
+        yield
+    finally:
+        await batcher.stop()
+
+app = FastAPI(title="Content Writing Agent", lifespan=lifespan)
+
+# Task keywords; when keywords of several tasks match, the earliest task wins
+TASK_KEYWORDS = [
+    ("editing", ["edit", "improve", "grammar", "clarity", "fix"]),
+    ("content_creation", ["write", "create", "generate", "draft"]),
+    ("summarization", ["summarize", "summary", "tl;dr", "shorten"]),
+    ("style_adaptation", ["adapt", "style", "tone", "rewrite"]),
+]
+
+# All task keywords compiled into one automaton, so a query is matched in a single pass
+task_automaton = ahocorasick.Automaton()
+for priority, (task_name, keywords) in enumerate(TASK_KEYWORDS):
+    for keyword in keywords:
+        task_automaton.add_word(keyword, (priority, task_name))
+task_automaton.make_automaton()
+
+# Prompt template per task, filled with the user's request
+PROMPTS = {
+    "general": "Fulfill the following request: '{q}'",
+    "editing": "The user wants to edit a piece of text. Here is their request: '{q}'. Please provide only the edited text as a response.",
+    "content_creation": "The user wants to create content. Here is their request: '{q}'. Please provide only the generated content as a response.",
+    "summarization": "The user wants to summarize a piece of text. Here is their request: '{q}'. Please provide only the summary as a response.",
+    "style_adaptation": "The user wants to adapt the style of a piece of text. Here is their request: '{q}'. Please provide only the adapted text as a response.",
+}
+
+def match_task(query_text: str) -> str:
+    """Return the highest-priority task whose keywords appear in the query."""
+    matches = [match for _, match in task_automaton.iter(query_text)]
+    return min(matches)[1] if matches else "general"
+
+def build_prompt(query: str, query_text: str) -> Tuple[str, str]:
+    """Pick the writing task from the case-folded query_text and build the Gemini prompt for query."""
+    task = match_task(query_text)
+    return task, PROMPTS[task].format(q=query)
+
+def resolve_service_tier(query_data: Query, task: str) -> str:
+    """Use the caller's tier if given, otherwise pick one from interactivity and task."""
+    if query_data.service_tier:
+        return query_data.service_tier
+    if query_data.context and query_data.context.get("interactive"):
+        return "priority"
+    if task in FLEX_TASKS:
+        return "flex"
+    return "standard"
 
 @app.post("/query", response_model=Response)
 async def process_query(query_data: Query):
@@ -33,33 +274,57 @@ async def process_query(query_data: Query):
     - Style adaptation
     - Summarization
     """
-    query_text = query_data.query.lower()
-    model = genai.GenerativeModel('gemini-1.5-flash')
-
-    task = "general"
-    prompt = f"Fulfill the following request: '{query_data.query}'"
-
-    if any(k in query_text for k in ["edit", "improve", "grammar", "clarity", "fix"]):
-        task = "editing"
-        prompt = f"The user wants to edit a piece of text. Here is their request: '{query_data.query}'. Please provide only the edited text as a response."
-    elif any(k in query_text for k in ["write", "create", "generate", "draft"]):
-        task = "content_creation"
-        prompt = f"The user wants to create content. Here is their request: '{query_data.query}'. Please provide only the generated content as a response."
-    elif any(k in query_text for k in ["summarize", "summary", "tl;dr", "shorten"]):
-        task = "summarization"
-        prompt = f"The user wants to summarize a piece of text. Here is their request: '{query_data.query}'. Please provide only the summary as a response."
-    elif any(k in query_text for k in ["adapt", "style", "tone", "rewrite"]):
-        task = "style_adaptation"
-        prompt = f"The user wants to adapt the style of a piece of text. Here is their request: '{query_data.query}'. Please provide only the adapted text as a response."
-
-    response = model.generate_content(prompt)
-    response_text = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
-
-    return Response(
-        result=response_text,
-        confidence=0.95,
-        metadata={"task": task}
+    query_text = query_data.query.casefold()
+    task, prompt = build_prompt(query_data.query, query_text)
+    service_tier = resolve_service_tier(query_data, task)
+    response_text = await get_or_compute(task, query_data.query, prompt, service_tier)
+
+    return {
+        "result": response_text,
+        "confidence": 0.95,
+        "metadata": {"task": task, "service_tier": service_tier}
+    }
+
+@app.post("/batch_query")
+def submit_batch_query(queries: List[Query]):
+    """
+    Submit many queries as a single Gemini Batch job.
+
+    Batch jobs are billed at half the interactive price and are not subject to
+    the per-request rate limits, at the cost of completing asynchronously. Use
+    /query for interactive traffic.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as batch_file:
+        for i, query_data in enumerate(queries):
+            _, prompt = build_prompt(query_data.query, query_data.query.casefold())
+            request = {"contents": [{"parts": [{"text": prompt}]}]}
+            batch_file.write(json.dumps({"key": str(i), "request": request}) + "\n")
+
+    try:
+        uploaded = get_genai_client().files.upload(
+            file=batch_file.name,
+            config={"display_name": "content-writing-batch", "mime_type": "jsonl"}
+        )
+    finally:
+        os.remove(batch_file.name)
+
+    job = get_genai_client().batches.create(
+        model=MODEL_NAME,
+        src={"file_name": uploaded.name},
+        config={"display_name": "content-writing-batch"}
     )
+    return {"job_id": job.name, "state": job.state.name, "count": len(queries)}
+
+@app.get("/batch_query/{job_id:path}")
+def get_batch_query(job_id: str):
+    """Report the state of a batch job, returning its JSONL results once it has succeeded."""
+    job = get_genai_client().batches.get(name=job_id)
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        return {"job_id": job.name, "state": job.state.name}
+
+    results = get_genai_client().files.download(file=job.dest.file_name)
+    # The SDK hands back the whole file as bytes, so there is nothing to stream
+    return HttpResponse(content=results, media_type="application/jsonl")
 
 @app.get("/capabilities")
 async def get_capabilities():
@@ -71,4 +336,4 @@ async def get_capabilities():
     }
 
 if __name__ == "__main__":
-    uvicorn.run("content_writing_agent:app", host="0.0.0.0", port=8002, reload=True)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
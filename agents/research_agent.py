@@ -1,10 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 import uvicorn
-import pandas as pd
+import polars as pl
+import ahocorasick
 import glob
 import os
+import sqlite3
+import json
+import fcntl
+import faiss
+import asyncio
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from agents._embeddings import MODEL_ID as EMBEDDING_MODEL_ID, encode
+from agents._files import replace_file
 
 class Query(BaseModel):
     query: str
@@ -15,9 +26,240 @@ class Response(BaseModel):
     confidence: float
     metadata: Optional[Dict[str, Any]] = None
 
-app = FastAPI(title="Research Agent")
+# Keywords that mark a query as a search over the Twitter data
+SEARCH_INTENT_KEYWORDS = ["find", "search", "analyze", "information", "review", "posts", "tweet", "twitter", "experiences", "feedback", "critiques"]
 
-DATA_DIR = "../data"
+# Keyword -> search term; when several keywords match, the earliest entry wins
+SEARCH_TERM_KEYWORDS = [
+    # Airline-specific keywords
+    ("skyglide", "skyglide"),
+    ("airvista", "airvista"),
+    ("aeroexpress", "aeroexpress"),
+    ("horizonhawk", "horizonhawk"),
+    ("flight delay", "delay"),
+    ("delayed", "delay"),
+    # General keywords
+    ("covid-19", "covid"),
+    ("covid", "covid"),
+    ("climate change", "climate"),
+    ("stock market", "stock"),
+    ("stock", "stock"),
+    ("self driving", "self driving"),
+    ("self-driving", "self driving"),
+    ("metoo", "metoo"),
+]
+
+# All keywords compiled into one automaton, so a query is matched in a single pass
+keyword_automaton = ahocorasick.Automaton()
+for keyword in SEARCH_INTENT_KEYWORDS:
+    keyword_automaton.add_word(keyword, (None, None))
+for priority, (keyword, search_term) in enumerate(SEARCH_TERM_KEYWORDS):
+    keyword_automaton.add_word(keyword, (priority, search_term))
+keyword_automaton.make_automaton()
+
+def match_keywords(query_text: str):
+    """Return whether the query asks for a search, and the search term it names (if any)."""
+    is_search = False
+    best = None
+    for _, (priority, search_term) in keyword_automaton.iter(query_text):
+        if priority is None:
+            is_search = True
+        elif best is None or priority < best[0]:
+            best = (priority, search_term)
+    return is_search, best[1] if best else None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+# Full-text index over every post, so a search is a single FTS5 lookup instead of a CSV scan.
+# Opened per worker process at startup: an SQLite connection must not be carried across a fork.
+index_db: Optional[sqlite3.Connection] = None
+indexed_mtimes: Dict[str, float] = {}
+
+def open_index():
+    global index_db, indexed_mtimes
+    index_db = sqlite3.connect(":memory:", check_same_thread=False)
+    index_db.execute("CREATE VIRTUAL TABLE posts USING fts5(file UNINDEXED, post, tokenize='trigram')")
+    indexed_mtimes = {}
+
+def list_csv_files() -> Tuple[str, ...]:
+    return tuple(sorted(glob.glob(f"{DATA_DIR}/*.csv")))
+
+# The CSV list is read once and replaced wholesale (never mutated) when the watcher sees files come or go
+csv_files = list_csv_files()
+
+class CsvDirectoryHandler(FileSystemEventHandler):
+    """Refresh the cached CSV list when files are created, deleted or renamed in the data directory."""
+
+    def on_created(self, event):
+        global csv_files
+        csv_files = list_csv_files()
+
+    on_deleted = on_created
+    on_moved = on_created
+
+# The watcher thread is started per worker process: threads do not survive the fork when workers are preloaded
+csv_observer: Optional[Observer] = None
+
+def start_csv_observer():
+    global csv_observer
+    csv_observer = Observer()
+    csv_observer.schedule(CsvDirectoryHandler(), DATA_DIR)
+    csv_observer.start()
+
+def stop_csv_observer():
+    global csv_observer
+    if csv_observer:
+        csv_observer.stop()
+        csv_observer = None
+
+def load_posts(file: str) -> List[str]:
+    """Parse one CSV into its list of posts, or an empty list if it can't be read."""
+    try:
+        df = pl.read_csv(file, has_header=False, new_columns=["post"], schema_overrides={"post": pl.Utf8})
+    except Exception as e:
+        return []
+    return df["post"].drop_nulls().to_list()
+
+def index_changes() -> Tuple[Dict[str, float], Set[str], List[str]]:
+    """Return the current CSV mtimes, the indexed files that changed or vanished, and the files to (re)load."""
+    mtimes = {}
+    for file in csv_files:
+        try:
+            mtimes[file] = os.path.getmtime(file)
+        except FileNotFoundError:
+            # Deleted before the watcher caught up
+            continue
+    # A file is keyed by (path, mtime): unchanged files keep their rows and are never re-parsed
+    stale = {file for file in indexed_mtimes if mtimes.get(file) != indexed_mtimes[file]}
+    fresh = sorted(file for file in mtimes if indexed_mtimes.get(file) != mtimes[file])
+    return mtimes, stale, fresh
+
+def apply_changes(mtimes: Dict[str, float], stale: Set[str], parsed: Dict[str, List[str]]):
+    """Swap the rows of stale files for the freshly parsed posts."""
+    global indexed_mtimes
+    with index_db:
+        for file in stale:
+            index_db.execute("DELETE FROM posts WHERE file = ?", (os.path.basename(file),))
+        for file, posts in parsed.items():
+            index_db.executemany(
+                "INSERT INTO posts (file, post) VALUES (?, ?)",
+                ((os.path.basename(file), post) for post in posts)
+            )
+    indexed_mtimes = mtimes
+
+def refresh_index():
+    """Re-index only the CSVs that were added, removed or modified since the last refresh."""
+    mtimes, stale, fresh = index_changes()
+    if mtimes != indexed_mtimes:
+        apply_changes(mtimes, stale, {file: load_posts(file) for file in fresh})
+
+refresh_lock = asyncio.Lock()
+
+async def refresh_index_async():
+    """Like refresh_index, but stats and parses CSVs in worker threads so the event loop keeps serving."""
+    async with refresh_lock:
+        mtimes, stale, fresh = await asyncio.to_thread(index_changes)
+        if mtimes == indexed_mtimes:
+            return
+        # Parse changed files concurrently; Polars releases the GIL while reading
+        parsed = await asyncio.gather(*(asyncio.to_thread(load_posts, file) for file in fresh))
+        apply_changes(mtimes, stale, dict(zip(fresh, parsed)))
+
+def search_posts(search_term: str) -> List[Dict[str, Any]]:
+    """Return per-file match counts and up to three example posts containing the search term."""
+    # Trigram tokens make a quoted term a case-insensitive substring match, like the old `term in post.lower()` scan
+    # (e.g. "delay" in "#FlightDelay"); every search term is at least three characters long
+    match_query = '"' + search_term.replace('"', '""') + '"'
+    rows = index_db.execute(
+        """
+        SELECT file, post, total FROM (
+            SELECT file, post,
+                   COUNT(*) OVER (PARTITION BY file) AS total,
+                   ROW_NUMBER() OVER (PARTITION BY file ORDER BY rowid) AS n
+            FROM posts WHERE posts MATCH ?
+        )
+        WHERE n <= 3
+        ORDER BY file
+        """,
+        (match_query,)
+    )
+    results: Dict[str, Dict[str, Any]] = {}
+    for file, post, total in rows:
+        result = results.setdefault(file, {"file": file, "count": total, "examples": []})
+        result["examples"].append(post)
+    return list(results.values())
+
+# Semantic index over the same posts, for searches that name no specific keyword.
+# Embedding the corpus is slow, so it is persisted next to the data and rebuilt only when the CSVs change.
+SEMANTIC_INDEX_PATH = os.path.join(DATA_DIR, "index.faiss")
+SEMANTIC_ROWS_PATH = os.path.join(DATA_DIR, "index_rows.json")
+# Serializes building the index across worker processes
+SEMANTIC_LOCK_PATH = os.path.join(DATA_DIR, "index.lock")
+
+def read_semantic_index(fingerprint: Dict[str, float]) -> Optional[Tuple[faiss.Index, List[Tuple[str, str]]]]:
+    """Return the persisted index if it was built by the current model from the current CSVs."""
+    if not (os.path.exists(SEMANTIC_INDEX_PATH) and os.path.exists(SEMANTIC_ROWS_PATH)):
+        return None
+    with open(SEMANTIC_ROWS_PATH) as f:
+        saved = json.load(f)
+    if saved.get("model") != EMBEDDING_MODEL_ID or saved["mtimes"] != fingerprint:
+        return None
+    return faiss.read_index(SEMANTIC_INDEX_PATH), [tuple(row) for row in saved["rows"]]
+
+def write_rows(path: str, saved: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(saved, f)
+
+def load_semantic_index() -> Tuple[faiss.Index, List[Tuple[str, str]]]:
+    """Load the persisted HNSW index, or embed every indexed post and persist a new one if it is missing or stale."""
+    fingerprint = {os.path.basename(file): mtime for file, mtime in indexed_mtimes.items()}
+    with open(SEMANTIC_LOCK_PATH, "a") as lock_file:
+        # Readers share the lock, so they never load an index file and a rows file from different builds
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        loaded = read_semantic_index(fingerprint)
+        if loaded:
+            return loaded
+
+        # Only one process embeds the corpus; the others wait here and then load its result
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        loaded = read_semantic_index(fingerprint)
+        if loaded:
+            return loaded
+
+        rows = index_db.execute("SELECT file, post FROM posts ORDER BY rowid").fetchall()
+        embeddings = encode([post for _, post in rows])
+        index = faiss.IndexHNSWFlat(embeddings.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(embeddings)
+        replace_file(SEMANTIC_INDEX_PATH, lambda path: faiss.write_index(index, path))
+        replace_file(SEMANTIC_ROWS_PATH, lambda path: write_rows(path, {"model": EMBEDDING_MODEL_ID, "mtimes": fingerprint, "rows": rows}))
+        return index, rows
+
+semantic_index: Optional[faiss.Index] = None
+semantic_rows: List[Tuple[str, str]] = []
+
+def semantic_search(query: str, k: int = 3) -> List[Dict[str, Any]]:
+    """Return the k posts closest in meaning to the query."""
+    scores, ids = semantic_index.search(encode([query]), k)
+    return [
+        {"file": semantic_rows[i][0], "post": semantic_rows[i][1], "score": float(score)}
+        for score, i in zip(scores[0], ids[0]) if i >= 0
+    ]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global semantic_index, semantic_rows
+    # Both indexes are built per worker rather than at import: under gunicorn --preload the import runs
+    # in the master, and the Polars and ONNX Runtime thread pools used to build them do not survive the fork
+    open_index()
+    refresh_index()
+    semantic_index, semantic_rows = load_semantic_index()
+    start_csv_observer()
+    try:
+        yield
+    finally:
+        stop_csv_observer()
+
+app = FastAPI(title="Research Agent", lifespan=lifespan)
 
 @app.post("/query", response_model=Response)
 async def process_query(query_data: Query):
@@ -31,100 +273,74 @@ async def process_query(query_data: Query):
     - Literature review
     - Source discovery
     """
-    query_text = query_data.query.lower()
+    # Case-fold once; the keyword match and every check below reuse it
+    query_text = query_data.query.casefold()
+    is_search, search_term = match_keywords(query_text)
     
     # If the query is about searching, finding, or analyzing, search the CSVs
-    if any(k in query_text for k in ["find", "search", "analyze", "information", "review", "posts", "tweet", "twitter", "experiences", "feedback", "critiques"]):
-        
-        search_term = None
-        # Airline-specific keywords
-        if "skyglide" in query_text:
-            search_term = "skyglide"
-        elif "airvista" in query_text:
-            search_term = "airvista"
-        elif "aeroexpress" in query_text:
-            search_term = "aeroexpress"
-        elif "horizonhawk" in query_text:
-            search_term = "horizonhawk"
-        elif "flight delay" in query_text or "delayed" in query_text:
-            search_term = "delay"
-        # General keywords
-        elif "covid-19" in query_text or "covid" in query_text:
-            search_term = "covid"
-        elif "climate change" in query_text:
-            search_term = "climate"
-        elif "stock market" in query_text or "stock" in query_text:
-            search_term = "stock"
-        elif "self driving" in query_text or "self-driving" in query_text:
-            search_term = "self driving"
-        elif "metoo" in query_text:
-            search_term = "metoo"
-
+    if is_search:
         if search_term:
-            # Gather all CSV files in the data directory
-            csv_files = glob.glob(f"{DATA_DIR}/*.csv")
-            results = []
-            for file in csv_files:
-                try:
-                    df = pd.read_csv(file, header=None, names=["post"])
-                    # Search for posts containing the determined search term
-                    matches = df[df["post"].str.lower().str.contains(search_term, na=False)]
-                    if not matches.empty:
-                        results.append({
-                            "file": os.path.basename(file),
-                            "count": len(matches),
-                            "examples": matches["post"].head(3).tolist()
-                        })
-                except Exception as e:
-                    continue
-            
+            await refresh_index_async()
+            results = search_posts(search_term)
+
             if results:
                 summary = f"Found relevant posts in {len(results)} file(s).\n"
                 for r in results:
                     summary += f"\nFile: {r['file']} (Matches: {r['count']})\nExamples: " + " | ".join(r['examples'])
-                return Response(
-                    result=summary,
-                    confidence=0.95,
-                    metadata={"files_with_matches": [r["file"] for r in results], "total_matches": sum(r["count"] for r in results)}
-                )
+                return {
+                    "result": summary,
+                    "confidence": 0.95,
+                    "metadata": {"files_with_matches": [r["file"] for r in results], "total_matches": sum(r["count"] for r in results)}
+                }
             else:
-                return Response(
-                    result="No relevant posts found in the Twitter data.",
-                    confidence=0.5,
-                    metadata={"searched_files": [os.path.basename(f) for f in csv_files]}
-                )
+                return {
+                    "result": "No relevant posts found in the Twitter data.",
+                    "confidence": 0.5,
+                    "metadata": {"searched_files": [os.path.basename(f) for f in sorted(indexed_mtimes)]}
+                }
+        else:
+            # No keyword to match exactly, so search by meaning instead
+            matches = await asyncio.to_thread(semantic_search, query_data.query)
+            summary = f"Found {len(matches)} related post(s).\n"
+            for m in matches:
+                summary += f"\nFile: {m['file']} (Similarity: {m['score']:.2f})\nPost: {m['post']}"
+            return {
+                "result": summary,
+                "confidence": 0.8,
+                "metadata": {"semantic_matches": matches}
+            }
 
     # Simulate research responses based on the query
     elif "find" in query_text or "search" in query_text or "information" in query_text:
-        return Response(
-            result="I've found several relevant sources on this topic. The most recent research from Stanford (2024) indicates that the hypothesis has strong empirical support across multiple studies.",
-            confidence=0.89,
-            metadata={"sources": 12, "primary_sources": 7, "recency": "high", "consensus_level": "strong"}
-        )
+        return {
+            "result": "I've found several relevant sources on this topic. The most recent research from Stanford (2024) indicates that the hypothesis has strong empirical support across multiple studies.",
+            "confidence": 0.89,
+            "metadata": {"sources": 12, "primary_sources": 7, "recency": "high", "consensus_level": "strong"}
+        }
     elif "fact check" in query_text or "verify" in query_text or "validate" in query_text:
-        return Response(
-            result="This claim appears to be partially accurate but missing important context. While the core statement is supported by evidence, there are significant qualifications noted in the literature.",
-            confidence=0.92,
-            metadata={"accuracy_rating": "partially accurate", "primary_sources_checked": 5, "contradictory_evidence": "minimal"}
-        )
+        return {
+            "result": "This claim appears to be partially accurate but missing important context. While the core statement is supported by evidence, there are significant qualifications noted in the literature.",
+            "confidence": 0.92,
+            "metadata": {"accuracy_rating": "partially accurate", "primary_sources_checked": 5, "contradictory_evidence": "minimal"}
+        }
     elif "literature" in query_text or "review" in query_text or "papers" in query_text:
-        return Response(
-            result="The literature review reveals three major schools of thought on this topic. The dominant view (supported by 65% of recent papers) favors the mechanistic explanation, while competing theories focus on emergent properties and contextual factors.",
-            confidence=0.94,
-            metadata={"papers_reviewed": 47, "time_period": "2020-2025", "major_researchers": ["Zhang", "Patel", "Yamamoto"]}
-        )
+        return {
+            "result": "The literature review reveals three major schools of thought on this topic. The dominant view (supported by 65% of recent papers) favors the mechanistic explanation, while competing theories focus on emergent properties and contextual factors.",
+            "confidence": 0.94,
+            "metadata": {"papers_reviewed": 47, "time_period": "2020-2025", "major_researchers": ["Zhang", "Patel", "Yamamoto"]}
+        }
     elif "background" in query_text or "context" in query_text:
-        return Response(
-            result="This field emerged in the early 2010s and has seen exponential growth since 2018. The foundational work by Rodriguez et al. established the theoretical framework that most current research builds upon.",
-            confidence=0.91,
-            metadata={"historical_depth": "comprehensive", "key_developments": 4, "paradigm_shifts": 1}
-        )
+        return {
+            "result": "This field emerged in the early 2010s and has seen exponential growth since 2018. The foundational work by Rodriguez et al. established the theoretical framework that most current research builds upon.",
+            "confidence": 0.91,
+            "metadata": {"historical_depth": "comprehensive", "key_developments": 4, "paradigm_shifts": 1}
+        }
     else:
-        return Response(
-            result="I've researched your query and compiled relevant information from authoritative sources. The consensus view suggests the phenomenon is well-established, though some aspects remain under investigation.",
-            confidence=0.80,
-            metadata={"general_research": True, "confidence_factors": ["topic breadth", "evolving field"]}
-        )
+        return {
+            "result": "I've researched your query and compiled relevant information from authoritative sources. The consensus view suggests the phenomenon is well-established, though some aspects remain under investigation.",
+            "confidence": 0.80,
+            "metadata": {"general_research": True, "confidence_factors": ["topic breadth", "evolving field"]}
+        }
 
 @app.get("/capabilities")
 async def get_capabilities():
@@ -136,4 +352,4 @@ async def get_capabilities():
     }
 
 if __name__ == "__main__":
-    uvicorn.run("research_agent:app", host="0.0.0.0", port=8001, reload=True)
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -1,13 +1,21 @@
-import subprocess
-import time
-import sys
-import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Any, List, Optional
 import uvicorn
-import threading
+import logging
+import os
+import asyncio
+from urllib.parse import urlsplit
 
-from orchestrator.orchestrator_agent import run_orchestrator
+from orchestrator.orchestrator_agent import current_registry, get_router_model, router_cache, run_orchestrator
+from agents.research_agent import app as research_app
+from agents.content_writing_agent import app as content_writing_app
+from agents._http import close_client, get_client, mount_internal
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+# httpx logs every request at INFO, which would mean one line per agent call
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 class QueryInput(BaseModel):
     query: str
@@ -15,7 +23,58 @@ class QueryInput(BaseModel):
 class QueryResponse(BaseModel):
     response: str
 
-app = FastAPI(title="Agent Orchestrator API")
+class BatchQueryInput(BaseModel):
+    queries: List[str] = Field(max_length=100)
+
+class BatchQueryResponse(BaseModel):
+    responses: List[QueryResponse]
+
+BATCH_QUERY_CONCURRENCY = 20
+
+class BatchRequestItem(BaseModel):
+    id: str
+    url: str
+    method: str = "POST"
+    body: Optional[Any] = None
+
+class BatchInput(BaseModel):
+    requests: List[BatchRequestItem] = Field(max_length=100)
+
+class BatchResponseItem(BaseModel):
+    id: str
+    status: int
+    body: Any = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchResponseItem]
+
+BATCH_CONCURRENCY = 20
+# Batch endpoints can't be nested in /batch: each one would fan out up to 100 more requests past the limit
+BATCH_PATHS = {"/batch", "/query/batch"}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the mounted agents' startup and shutdown hooks, which mounts do not receive on their own"""
+    async with research_app.router.lifespan_context(research_app), \
+            content_writing_app.router.lifespan_context(content_writing_app):
+        # Each worker sets up its own router model and context cache before taking traffic
+        await asyncio.to_thread(get_router_model, current_registry())
+        yield
+        await close_client()
+        router_cache.save()
+
+app = FastAPI(title="Agent Orchestrator API", lifespan=lifespan)
+
+# Serve the agents from this process; the orchestrator calls them over ASGI
+app.mount("/research", research_app)
+app.mount("/content", content_writing_app)
+
+# Agents served in this process are reached over ASGI instead of loopback TCP;
+# any other registry endpoint still goes out over the network
+mount_internal("research.internal", research_app)
+mount_internal("content-writing.internal", content_writing_app)
+# Batch sub-requests are dispatched back into this app over ASGI
+mount_internal("api.internal", app)
 
 @app.post("/query")
 async def process_query(query_input: QueryInput):
@@ -26,81 +85,70 @@ async def process_query(query_input: QueryInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
-def start_agent_server(script_path, port):
-    """Start an agent server in a separate process"""
-    # Get the directory of the script
-    script_dir = os.path.dirname(os.path.abspath(script_path))
-    script_name = os.path.basename(script_path)
-    
-    # Change to the script's directory and run the server
-    # This ensures that imports in the script will work correctly
-    cmd = [sys.executable, script_name]
-    
-    # Start the process
-    process = subprocess.Popen(
-        cmd,
-        cwd=script_dir,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    
-    # Wait for the server to start
-    time.sleep(2)
-    
-    # Check if the process is still running
-    if process.poll() is not None:
-        stdout, stderr = process.communicate()
-        print(f"Failed to start agent on port {port}:")
-        print(f"STDOUT: {stdout}")
-        print(f"STDERR: {stderr}")
-        return None
-    
-    print(f"Started agent server on port {port}")
-    return process
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def process_query_batch(batch_input: BatchQueryInput):
+    """Process up to 100 queries through the orchestrator concurrently, returned in input order"""
+    semaphore = asyncio.Semaphore(BATCH_QUERY_CONCURRENCY)
 
-def start_orchestrator_api():
-    """Start the orchestrator API server"""
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False)
+    async def run_one(query: str) -> str:
+        async with semaphore:
+            # Batched queries are not interactive, so agents may serve them at a cheaper tier
+            return await run_orchestrator(query, interactive=False)
 
-if __name__ == "__main__":    # Start the agent servers
-    research_agent_process = start_agent_server(
-        "agents/research_agent.py", 
-        8001
-    )
-    
-    content_writing_process = start_agent_server(
-        "agents/content_writing_agent.py", 
-        8002
+    results = await asyncio.gather(*[run_one(q) for q in batch_input.queries], return_exceptions=True)
+    # A failing query is reported in its slot instead of failing the whole batch
+    return BatchQueryResponse(responses=[
+        QueryResponse(response=f"Error processing query: {str(r)}" if isinstance(r, Exception) else r)
+        for r in results
+    ])
+
+@app.post("/batch", response_model=BatchResponse)
+async def process_batch(batch_input: BatchInput):
+    """
+    Execute several API requests in one round-trip.
+
+    Each sub-request names a path on this server (e.g. /query, /research/query,
+    /content/query); up to 100 of them run, 20 at a time, and their responses
+    are returned in request order, matched by id.
+    """
+    client = get_client()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def dispatch(item: BatchRequestItem) -> BatchResponseItem:
+        if not item.url.startswith("/") or urlsplit(item.url).path.rstrip("/") in BATCH_PATHS:
+            return BatchResponseItem(id=item.id, status=400, body={"detail": f"Invalid batch url: {item.url}"})
+        try:
+            async with semaphore:
+                response = await client.request(item.method, f"http://api.internal{item.url}", json=item.body, timeout=None)
+        except Exception as e:
+            # Errors raised by the mounted app surface here rather than as a response
+            return BatchResponseItem(id=item.id, status=500, body={"detail": f"Error processing request: {str(e)}"})
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        return BatchResponseItem(id=item.id, status=response.status_code, body=body)
+
+    responses = await asyncio.gather(*[dispatch(item) for item in batch_input.requests])
+    return BatchResponse(responses=responses)
+
+def start_orchestrator_api():
+    """Start the orchestrator API server with one worker process per core"""
+    # "auto" picks uvloop and httptools when they are installed (uvicorn[standard]) and falls back elsewhere
+    # Trust X-Forwarded-* only from the addresses in FORWARDED_ALLOW_IPS (the local proxy by default)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=os.cpu_count(),
+        loop="auto",
+        http="auto",
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
     )
-    
-    # Check if both servers started successfully
-    if research_agent_process is None or content_writing_process is None:
-        print("Failed to start one or more agent servers. Exiting.")
-        if research_agent_process is not None:
-            research_agent_process.terminate()
-        if content_writing_process is not None:
-            content_writing_process.terminate()
-        sys.exit(1)
-      # Start the orchestrator API in a separate thread
-    orchestrator_thread = threading.Thread(target=start_orchestrator_api, daemon=True)
-    orchestrator_thread.start()
-    
-    print("All services started!")
+
+if __name__ == "__main__":
     print("Orchestrator API running at: http://localhost:8000/query")
-    print("Research Agent running at: http://localhost:8001/query")
-    print("Content Writing Agent running at: http://localhost:8002/query")
-    
-    try:
-        # Keep the main thread alive
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Shutting down...")
-        # Terminate the processes
-        research_agent_process.terminate()
-        content_writing_process.terminate()
-        # Wait for processes to end
-        research_agent_process.wait()
-        content_writing_process.wait()
-        print("All services stopped.")
+    print("Research Agent running at: http://localhost:8000/research/query")
+    print("Content Writing Agent running at: http://localhost:8000/content/query")
+    start_orchestrator_api()
@@ -1,165 +1,448 @@
-from typing import Dict, List, Any, Optional, TypedDict, Literal
+from typing import Dict, List, Any, Mapping, Optional, TypedDict, Literal
 from langchain_core.messages import BaseMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
-import configparser
-import httpx
 import os
 import google.generativeai as genai
 import asyncio
 import json
+import logging
+import orjson
+import re
+import hashlib
+import pickle
+import threading
+import time
+import datetime
+import numpy as np
+from collections import OrderedDict
+from contextlib import aclosing
+from functools import lru_cache
+from types import MappingProxyType
 from langgraph.graph import StateGraph, END
 from dotenv import load_dotenv
+from agents._http import get_client
+from agents._embeddings import MODEL_ID as EMBEDDING_MODEL_ID, encode
+from agents._files import replace_file
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Define the state for our graph
 class AgentState(TypedDict):
     messages: List[BaseMessage]
+    query: str  # latest human message, extracted once when the graph starts
+    interactive: bool  # a caller is waiting on this query, so agents should answer at priority
     current_agent: Optional[str]
     next_action: Literal["ROUTE", "PROCESS", "END"]
     response: Optional[str]
 
+class AgentRegistry:
+    """A parsed registry file together with the lookups and router prompt derived from it."""
+
+    def __init__(self, agents: Mapping[str, Mapping[str, Any]]):
+        self.agents = agents
+        self.valid_ids = frozenset(agents)
+        # Flat per-field lookups for the request path
+        self.endpoint_by_id = {agent_id: details["endpoint"] for agent_id, details in agents.items()}
+        self.name_by_id = {agent_id: details["name"] for agent_id, details in agents.items()}
+        # Identifies this version of the registry in cache keys
+        self.hash = hashlib.sha256(
+            json.dumps({agent_id: dict(details) for agent_id, details in agents.items()}, sort_keys=True).encode()
+        ).hexdigest()
+        self.prompt_prefix = build_router_prefix(agents)
+
 # Function to read agent registry
-def read_agent_registry(file_path: str) -> Dict[str, Dict[str, Any]]:
-    """Read agent registry file and return parsed data."""
-    config = configparser.ConfigParser()
-    config.read(file_path)
+def read_agent_registry(file_path: str) -> AgentRegistry:
+    """Read agent registry file and return parsed data, re-parsing only when the file changes."""
+    return parse_agent_registry(file_path, os.path.getmtime(file_path))
+
+@lru_cache(maxsize=8)
+def parse_agent_registry(file_path: str, mtime: float) -> AgentRegistry:
+    """Parse the registry file; read-only so the cached result can be shared safely."""
+    with open(file_path, "rb") as f:
+        entries = orjson.loads(f.read())
     
     registry = {}
-    for section in config.sections():
-        registry[section] = {
-            "name": config.get(section, "name"),
-            "description": config.get(section, "description"),
-            "endpoint": config.get(section, "endpoint"),
-            "capabilities": json.loads(config.get(section, "capabilities").replace("'", '"'))
-        }
+    for agent_id, details in entries.items():
+        registry[agent_id] = MappingProxyType({
+            "name": details["name"],
+            "description": details["description"],
+            "endpoint": details["endpoint"],
+            "capabilities": tuple(details["capabilities"])
+        })
     
-    return registry
+    return AgentRegistry(MappingProxyType(registry))
 
-# Initialize the agent registry
-agent_registry = read_agent_registry("config/agent_registry.txt")
+REGISTRY_PATH = "config/agent_registry.json"
+
+def current_registry() -> AgentRegistry:
+    """Return the registry as currently on disk; costs one stat unless the file changed."""
+    return read_agent_registry(REGISTRY_PATH)
+JSON_HEADERS = {"content-type": "application/json"}
 
 # Set up Gemini API key
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GEMINI_API_KEY)
 
+def write_pickle(path: str, state: Dict[str, Any]) -> None:
+    with open(path, "wb") as f:
+        pickle.dump(state, f)
+
+class RouterCache:
+    """
+    Semantic cache of routing decisions.
+
+    A query whose embedding is within `threshold` cosine similarity of an earlier
+    query reuses that query's agent instead of asking Gemini again. Entries expire
+    after `ttl` seconds, the least recently used entry is evicted beyond `maxsize`,
+    the whole cache is dropped when the agent registry changes, and the cache is
+    pickled to `path` so a restarted process starts warm.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.92, maxsize: int = 10_000, ttl: float = 24 * 3600):
+        self.path = path
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Lookups and inserts may come from worker threads, so every access goes through the lock
+        self.lock = threading.Lock()
+        # Rows [0, len(agents)) are live; the rest is spare capacity, grown by doubling so adds don't copy every row
+        self.embeddings: Optional[np.ndarray] = None
+        self.registry_hash: Optional[str] = None
+        self.agents: List[str] = []
+        self.created: List[float] = []
+        self.last_used: List[float] = []
+        self.load()
+
+    def lookup(self, embedding: np.ndarray, registry_hash: str) -> Optional[str]:
+        """Return the agent of the most similar cached query, if it is similar enough."""
+        with self.lock:
+            self._check_registry(registry_hash)
+            self._expire()
+            if not self.agents:
+                return None
+            # One vectorized dot product against every cached (normalized) embedding
+            scores = self.embeddings[:len(self.agents)] @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self.last_used[best] = time.time()
+            return self.agents[best]
+
+    def add(self, embedding: np.ndarray, agent_id: str, registry_hash: str):
+        with self.lock:
+            self._check_registry(registry_hash)
+            if len(self.agents) >= self.maxsize:
+                self._drop([int(np.argmin(self.last_used))])
+            if self.embeddings is None or len(self.agents) == len(self.embeddings):
+                self._grow(embedding.shape[0])
+            now = time.time()
+            self.embeddings[len(self.agents)] = embedding
+            self.agents.append(agent_id)
+            self.created.append(now)
+            self.last_used.append(now)
+
+    def save(self):
+        """Persist the cache, replacing the file atomically."""
+        with self.lock:
+            state = {
+                "model": EMBEDDING_MODEL_ID,
+                "registry": self.registry_hash,
+                "embeddings": None if self.embeddings is None else self.embeddings[:len(self.agents)],
+                "agents": self.agents,
+                "created": self.created,
+                "last_used": self.last_used,
+            }
+            # A temp file per writer, so workers saving at the same time don't interleave
+            replace_file(self.path, lambda path: write_pickle(path, state))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            logger.warning("[RouterCache] Ignoring unreadable cache file: %s", e)
+            return
+        # Embeddings from a different model are not comparable
+        if state.get("model") != EMBEDDING_MODEL_ID:
+            return
+        self.embeddings = state["embeddings"]
+        # Files written before the registry was recorded are dropped on first use, like any registry change
+        self.registry_hash = state.get("registry")
+        self.agents = state["agents"]
+        self.created = state["created"]
+        self.last_used = state["last_used"]
+
+    def _check_registry(self, registry_hash: str):
+        # Decisions made against a different set of agents are not reusable
+        if registry_hash != self.registry_hash:
+            self.registry_hash = registry_hash
+            self._drop(list(range(len(self.agents))))
+
+    def _grow(self, dim: int):
+        size = len(self.agents)
+        grown = np.empty((min(self.maxsize, max(1024, 2 * size)), dim), dtype=np.float32)
+        if size:
+            grown[:size] = self.embeddings[:size]
+        self.embeddings = grown
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        self._drop([i for i, created in enumerate(self.created) if created < cutoff])
+
+    def _drop(self, indices: List[int]):
+        if not indices:
+            return
+        keep = np.ones(len(self.agents), dtype=bool)
+        keep[indices] = False
+        # Compact the live rows in place; the mask makes a copy, so the overlapping write is safe
+        live = self.embeddings[:len(self.agents)][keep]
+        self.embeddings[:len(live)] = live
+        self.agents = [a for a, k in zip(self.agents, keep) if k]
+        self.created = [c for c, k in zip(self.created, keep) if k]
+        self.last_used = [u for u, k in zip(self.last_used, keep) if k]
+
+ROUTER_EXACT_CACHE_SIZE = 10_000
+# Exact-match LRU of routing decisions, checked before any embedding work
+_router_exact_cache: "OrderedDict[str, str]" = OrderedDict()
+_router_exact_lock = threading.Lock()
+
+def router_cache_key(query: str, registry: AgentRegistry) -> str:
+    # Keys include the registry so decisions made against a different set of agents never match
+    return hashlib.sha256((query + registry.hash).encode()).hexdigest()
+
+def get_exact_route(key: str) -> Optional[str]:
+    with _router_exact_lock:
+        selected_agent = _router_exact_cache.get(key)
+        if selected_agent is not None:
+            _router_exact_cache.move_to_end(key)
+        return selected_agent
+
+def set_exact_route(key: str, selected_agent: str):
+    with _router_exact_lock:
+        _router_exact_cache[key] = selected_agent
+        _router_exact_cache.move_to_end(key)
+        if len(_router_exact_cache) > ROUTER_EXACT_CACHE_SIZE:
+            _router_exact_cache.popitem(last=False)
+
+# Routing in progress per cache key; all graph nodes run on the event loop, so no lock is needed
+inflight_routes: Dict[str, "asyncio.Task[Optional[str]]"] = {}
+
+def finish_route(cache_key: str, task: "asyncio.Task[Optional[str]]"):
+    if inflight_routes.get(cache_key) is task:
+        del inflight_routes[cache_key]
+    # Mark a failure as retrieved even if every caller was cancelled; waiting callers still receive it
+    if not task.cancelled():
+        task.exception()
+
+router_cache = RouterCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_cache.pkl"))
+
+ROUTER_MODEL_NAME = "gemini-2.5-flash-lite-preview-06-17"
+ROUTER_CONTEXT_TTL = datetime.timedelta(hours=1)
+
+def build_router_prefix(registry: Mapping[str, Mapping[str, Any]]) -> str:
+    """Build the static part of the router prompt; only the user query follows it."""
+    agent_descriptions = "".join(
+        f"- {agent_id}: {details['name']} - {details['description']} (Capabilities: {', '.join(details['capabilities'])})\n"
+        for agent_id, details in registry.items()
+    )
+    return (
+        "You are an orchestrator agent that routes queries to specialized agents.\n\n"
+        f"Available agents:\n{agent_descriptions}\n"
+        "Analyze the user query given after these instructions and determine which agent is best suited to handle it.\n"
+        "Select exactly one agent from the list above.\n\n"
+        "Output format: \nAGENT_NAME: <selected agent>\nREASON: <brief explanation for selection>\n"
+    )
+
+ROUTER_QUERY_LABEL = "\nUser query: "
+ROUTER_PROMPT_SUFFIX = "\n"
+# Only the AGENT_NAME line is used, so generation stops before the reason
+ROUTER_GENERATION_CONFIG = {"temperature": 0.0, "max_output_tokens": 40, "stop_sequences": ["\nREASON:"]}
+AGENT_LINE_RE = re.compile(r"^AGENT_NAME:[ \t]*(.+?)\s*$", re.MULTILINE)
+
+# Built once and reused whenever the prompt prefix can't be served from the context cache
+ROUTER_MODEL = genai.GenerativeModel(ROUTER_MODEL_NAME, generation_config=ROUTER_GENERATION_CONFIG)
+
+_router_model = None
+_router_prompt_prefix = ""
+_router_model_expires = 0.0
+_router_model_registry_hash = None
+_router_model_lock = threading.Lock()
+
+def get_router_model(registry: AgentRegistry):
+    """
+    Return the router model and the prompt prefix still to be sent with each query.
+
+    The static prefix is uploaded once as a Gemini context cache, so requests only
+    carry the query; it is rebuilt when it expires or the registry changes. If the
+    cache can't be created (e.g. the prefix is below the model's minimum cacheable
+    size) the plain model is used with the full prompt.
+    """
+    global _router_model, _router_prompt_prefix, _router_model_expires, _router_model_registry_hash
+    with _router_model_lock:
+        now = time.time()
+        if _router_model is not None and now < _router_model_expires and _router_model_registry_hash == registry.hash:
+            return _router_model, _router_prompt_prefix
+        try:
+            cached_content = genai.caching.CachedContent.create(
+                model=f"models/{ROUTER_MODEL_NAME}",
+                display_name="router-prefix",
+                contents=[registry.prompt_prefix],
+                ttl=ROUTER_CONTEXT_TTL,
+            )
+            _router_model = genai.GenerativeModel.from_cached_content(
+                cached_content=cached_content,
+                generation_config=ROUTER_GENERATION_CONFIG,
+            )
+            _router_prompt_prefix = ""
+        except Exception as e:
+            logger.warning("[get_router_model] Context caching unavailable, sending the full prompt: %s", e)
+            _router_model = ROUTER_MODEL
+            _router_prompt_prefix = registry.prompt_prefix
+        # Rebuild a minute before the server-side cache expires
+        _router_model_expires = now + ROUTER_CONTEXT_TTL.total_seconds() - 60
+        _router_model_registry_hash = registry.hash
+        return _router_model, _router_prompt_prefix
+
+def reply(state: AgentState, action: str, response: Optional[str] = None, agent: Optional[str] = None) -> AgentState:
+    """Copy the state once and set the node's outcome on the copy."""
+    result = state.copy()
+    result["next_action"] = action
+    if response is not None:
+        result["response"] = response
+    if agent is not None:
+        result["current_agent"] = agent
+    return result
+
 # Define a router model that will analyze the query and determine which agent to use
-def route_query(state: AgentState) -> AgentState:
+async def route_query(state: AgentState) -> AgentState:
     """Route the query to the appropriate agent based on its content."""
-    # Extract the last human message
-    human_messages = [msg for msg in state["messages"] if isinstance(msg, HumanMessage)]
-    if not human_messages:
-        print("[route_query] No human messages found.")
-        return {**state, "next_action": "END", "response": "No query provided."}
-    
-    query = human_messages[-1].content
-    
-    # Use a template to create a router prompt
-    router_template = """You are an orchestrator agent that routes queries to specialized agents.\n\nAvailable agents:\n{agent_descriptions}\n\nUser query: {query}\n\nAnalyze the query and determine which agent is best suited to handle it.\nSelect exactly one agent from the list above.\n\nOutput format: \nAGENT_NAME: <selected agent>\nREASON: <brief explanation for selection>\n"""
+    query = state["query"]
+    if not query:
+        logger.warning("[route_query] No query provided.")
+        return reply(state, "END", response="No query provided.")
+
+    registry = current_registry()
+
+    # Repeated queries are answered from the exact cache without embedding them
+    cache_key = router_cache_key(query, registry)
+    selected_agent = get_exact_route(cache_key)
+    if selected_agent:
+        logger.debug("[route_query] Exact router cache hit: %s", selected_agent)
+        return reply(state, "process", agent=selected_agent)
+
+    # Identical queries already being routed wait for that result instead of calling Gemini again.
+    # Routing runs as its own task, so cancelling any one caller (even the first) doesn't cancel it for the others.
+    task = inflight_routes.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(resolve_route(query, cache_key, registry))
+        inflight_routes[cache_key] = task
+        task.add_done_callback(lambda done: finish_route(cache_key, done))
+    else:
+        logger.debug("[route_query] Joining in-flight routing for the same query")
+    selected_agent = await asyncio.shield(task)
     
-    # Prepare agent descriptions
-    agent_descriptions = ""
-    for agent_id, details in agent_registry.items():
-        capabilities = ", ".join(details["capabilities"])
-        agent_descriptions += f"- {agent_id}: {details['name']} - {details['description']} (Capabilities: {capabilities})\n"
+    # If we couldn't determine an agent, provide a helpful response
+    if not selected_agent:
+        logger.warning("[route_query] Could not determine a valid agent.")
+        return reply(state, "END", response="I couldn't determine which agent would be best suited for your query. Could you please provide more specific information?")
     
-    router_prompt = router_template.format(agent_descriptions=agent_descriptions, query=query)
+    result_state = reply(state, "process", agent=selected_agent)
+    logger.debug("[route_query] Returning state: %s", result_state)
+    return result_state
+
+def chunk_text(chunk) -> str:
+    """Text of a streamed chunk; chunks carrying only a finish reason have no parts and yield ""."""
+    if not chunk.candidates:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts)
+
+async def resolve_route(query: str, cache_key: str, registry: AgentRegistry) -> Optional[str]:
+    """Pick an agent from the semantic cache or, failing that, Gemini; None if no valid agent is named."""
+    # Near-duplicates of an already routed query reuse its agent without calling Gemini
+    # Encoding is CPU-bound, so it runs off the event loop
+    try:
+        query_embedding = (await asyncio.to_thread(encode, [query]))[0]
+    except Exception as e:
+        # The semantic cache is only an optimisation, so a failing embedder counts as a miss
+        logger.warning("[resolve_route] Embedding failed, skipping the router cache: %s", e)
+        query_embedding = None
+    selected_agent = router_cache.lookup(query_embedding, registry.hash) if query_embedding is not None else None
+    if selected_agent and selected_agent in registry.valid_ids:
+        logger.debug("[resolve_route] Router cache hit: %s", selected_agent)
+        set_exact_route(cache_key, selected_agent)
+        return selected_agent
     
-    # Use Gemini to determine the routing
-    model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-06-17')
-    response = model.generate_content(router_prompt)
-    response_text = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
-    print("[route_query] Gemini model response:", response_text)
+    # Static instructions come first so they can be served from the context cache
+    model, prompt_prefix = await asyncio.to_thread(get_router_model, registry)
+    router_prompt = prompt_prefix + ROUTER_QUERY_LABEL + query + ROUTER_PROMPT_SUFFIX
     
-    # Parse the response to extract the selected agent
-    selected_agent = None
-    for line in response_text.split("\n"):
-        if line.startswith("AGENT_NAME:"):
-            selected_agent = line.split(":", 1)[1].strip()
-            break
-    print(f"[route_query] Selected agent: {selected_agent}")
+    # Use Gemini to determine the routing, streaming so we can stop as soon as the agent is named
+    response = await model.generate_content_async(router_prompt, stream=True)
+    response_text = ""
+    match = None
+    # aclosing finalizes our iterator over the response when we stop reading early. It does not cancel the
+    # request: the SDK keeps the gRPC call to itself, so Gemini finishes generating, but max_output_tokens
+    # and the REASON stop sequence keep that tail short. Breaking early only saves us the wait.
+    async with aclosing(response.__aiter__()) as chunks:
+        async for chunk in chunks:
+            response_text += chunk_text(chunk)
+            match = AGENT_LINE_RE.search(response_text)
+            # The line is complete once something follows it; a bare match may still be growing
+            if match and match.end() < len(response_text):
+                break
+    logger.debug("[resolve_route] Gemini model response: %s", response_text)
     
-    # If we couldn't determine an agent, provide a helpful response
-    if not selected_agent or selected_agent not in agent_registry:
-        print("[route_query] Could not determine a valid agent.")
-        return {
-            **state, 
-            "next_action": "END",
-            "response": "I couldn't determine which agent would be best suited for your query. Could you please provide more specific information?"
-        }
+    selected_agent = match.group(1) if match else None
+    logger.debug("[resolve_route] Selected agent: %s", selected_agent)
+    if not selected_agent or selected_agent not in registry.valid_ids:
+        return None
     
-    result_state = {
-        **state,
-        "current_agent": selected_agent,
-        "next_action": "process"
-    }
-    print("[route_query] Returning state:", result_state)
-    return result_state
+    set_exact_route(cache_key, selected_agent)
+    if query_embedding is not None:
+        router_cache.add(query_embedding, selected_agent, registry.hash)
+    return selected_agent
 
 # Define a function to process the query with the selected agent
 async def process_with_agent(state: AgentState) -> AgentState:
     """Process the query using the selected agent."""
-    print("[process_with_agent] Input state:", state)
+    logger.debug("[process_with_agent] Input state: %s", state)
+    registry = current_registry()
     agent_id = state["current_agent"]
-    if not agent_id or agent_id not in agent_registry:
-        print("[process_with_agent] No valid agent selected.")
-        return {
-            **state,
-            "next_action": "END",
-            "response": "No valid agent was selected for this query."
-        }
+    if not agent_id or agent_id not in registry.valid_ids:
+        logger.warning("[process_with_agent] No valid agent selected.")
+        return reply(state, "END", response="No valid agent was selected for this query.")
     
-    agent_details = agent_registry[agent_id]
-    endpoint = agent_details["endpoint"]
+    endpoint = registry.endpoint_by_id[agent_id]
+    agent_name = registry.name_by_id[agent_id]
+    query = state["query"]
     
-    # Extract the query from the last human message
-    human_messages = [msg for msg in state["messages"] if isinstance(msg, HumanMessage)]
-    if not human_messages:
-        print("[process_with_agent] No human messages found.")
-        return {**state, "next_action": "END", "response": "No query provided."}
-    
-    query = human_messages[-1].content
-    
-    # Send the query to the agent's API
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                endpoint,
-                json={"query": query},
-                timeout=10.0
-            )
-            print(f"[process_with_agent] Agent API response status: {response.status_code}")
-            if response.status_code == 200:
-                result = response.json()
-                print(f"[process_with_agent] Agent API response JSON: {result}")
-                # Format the response
-                formatted_response = result.get('result', '')
-                return {
-                    **state,
-                    "next_action": "END",
-                    "response": formatted_response
-                }
-            else:
-                print(f"[process_with_agent] Agent API error: {response.text}")
-                return {
-                    **state,
-                    "next_action": "END",
-                    "response": f"Error from {agent_details['name']}: {response.text}"
-                }
-        except Exception as e:
-            print(f"[process_with_agent] Exception: {str(e)}")
-            return {
-                **state,
-                "next_action": "END",
-                "response": f"Failed to communicate with {agent_details['name']}: {str(e)}"
-            }
-    # Fallback in case nothing above returns
-    print("[process_with_agent] Unexpected code path reached.")
-    return {
-        **state,
-        "next_action": "END",
-        "response": "No response generated by the agent."
-    }
+    # Send the query to the agent's API over the shared connection pool
+    client = get_client()
+    try:
+        async with client.stream(
+            "POST",
+            endpoint,
+            content=orjson.dumps({"query": query, "context": {"interactive": state["interactive"]}}),
+            headers=JSON_HEADERS
+        ) as response:
+            body = await response.aread()
+        logger.debug("[process_with_agent] Agent API response status: %d", response.status_code)
+        if response.status_code == 200:
+            result = orjson.loads(body)
+            logger.debug("[process_with_agent] Agent API response: %d bytes", len(body))
+            # Format the response
+            formatted_response = result.get('result', '')
+            return reply(state, "END", response=formatted_response)
+        else:
+            logger.warning("[process_with_agent] Agent API error: %s", response.text)
+            return reply(state, "END", response=f"Error from {agent_name}: {response.text}")
+    except Exception as e:
+        logger.error("[process_with_agent] Exception: %s", e)
+        return reply(state, "END", response=f"Failed to communicate with {agent_name}: {str(e)}")
 
 # Define a function to decide the next step in the workflow
 def decide_next_step(state: AgentState) -> Literal["route", "process", "end"]:
@@ -172,7 +455,7 @@ def build_orchestrator_graph():
     workflow = StateGraph(AgentState)
     
     # Add the nodes
-    workflow.add_node("route", route_query)
+    workflow.add_node("route", route_query)  # async node
     workflow.add_node("process", process_with_agent)  # async node
     
     # Define the conditional edges (CORRECTED)
@@ -190,11 +473,13 @@ def build_orchestrator_graph():
 
 orchestrator_graph = build_orchestrator_graph()
 
-async def run_orchestrator(query: str) -> str:
+async def run_orchestrator(query: str, interactive: bool = True) -> str:
     """Run the orchestrator with a given query and return the response."""
     # Initialize the state
     initial_state = {
         "messages": [HumanMessage(content=query)],
+        "query": query,
+        "interactive": interactive,
         "current_agent": None,
         "next_action": "ROUTE",
         "response": None
@@ -202,7 +487,7 @@ async def run_orchestrator(query: str) -> str:
     
     # Run the graph (async)
     final_state = await orchestrator_graph.ainvoke(initial_state)
-    print("[run_orchestrator] Final state after graph execution:", final_state)
+    logger.debug("[run_orchestrator] Final state after graph execution: %s", final_state)
     # Return the response, ensuring it's always a string
     response = final_state.get("response")
     return response if response is not None else "No response generated by the orchestrator."